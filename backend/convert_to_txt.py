@@ -2,137 +2,346 @@
 
 import os
 import glob
+import json
+import hashlib
 import argparse
 import shutil
-import traceback
 import logging
-from typing import List, Dict, Any, Optional
-
-# --- Required Langchain/Loader Imports ---
-try:
-    from langchain_community.document_loaders import (
-        PyPDFLoader,
-        TextLoader,
-        UnstructuredWordDocumentLoader,
-        UnstructuredPowerPointLoader,
-    )
-    from langchain.schema import Document
-except ImportError:
-    print("ERROR: Required libraries (langchain-community, pypdf, unstructured) not found.")
-    print("Please install them: pip install -r requirements_converter.txt")
-    exit(1)
-# --- End Imports ---
+import functools
+import importlib
+import multiprocessing
+import queue
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 log = logging.getLogger("DocConverter")
 # --- End Logging Setup ---
 
+# Loaders are referenced by (module, class) and imported on first use (see _get_loader),
+# so worker processes only pay for the libraries (langchain, pypdf, unstructured/nltk)
+# needed by the file types they actually see.
+_LANGCHAIN_LOADERS = "langchain_community.document_loaders"
 SUPPORTED_EXTENSIONS = {
-    ".pdf": PyPDFLoader,
-    ".txt": TextLoader,
-    ".md": TextLoader,
-    ".doc": UnstructuredWordDocumentLoader,
-    ".docx": UnstructuredWordDocumentLoader,
-    ".ppt": UnstructuredPowerPointLoader,
-    ".pptx": UnstructuredPowerPointLoader,
+    ".pdf": (_LANGCHAIN_LOADERS, "PyPDFLoader"),
+    ".txt": (_LANGCHAIN_LOADERS, "TextLoader"),
+    ".md": (_LANGCHAIN_LOADERS, "TextLoader"),
+    ".doc": (_LANGCHAIN_LOADERS, "UnstructuredWordDocumentLoader"),
+    ".docx": (_LANGCHAIN_LOADERS, "UnstructuredWordDocumentLoader"),
+    ".ppt": (_LANGCHAIN_LOADERS, "UnstructuredPowerPointLoader"),
+    ".pptx": (_LANGCHAIN_LOADERS, "UnstructuredPowerPointLoader"),
 }
+UNSTRUCTURED_LOADERS = frozenset({"UnstructuredWordDocumentLoader", "UnstructuredPowerPointLoader"})
 
-IGNORED_EXTENSIONS = {
+IGNORED_EXTENSIONS = frozenset({
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.zip', '.rar',
     '.exe', '.mp3', '.mp4', '.ipynb', '.pkl', '.bin', '.pt',
     '.safetensors', '.yaml', '.json', '.env', '.parquet', '.log', '.csv', '.html'
-}
+})
 
-def extract_text_from_file(filepath: str) -> Optional[str]:
-    """Loads a supported document file and extracts all text content."""
-    log.debug(f"Checking file: {filepath}")
+_ALLOWED_EXTENSIONS = frozenset(SUPPORTED_EXTENSIONS)
+_SUPPORTED_EXT_NAMES = frozenset(ext[1:] for ext in _ALLOWED_EXTENSIONS)
 
-    # --- CORRECTED HIDDEN FILE CHECK ---
-    filename = os.path.basename(filepath)
-    if filename.startswith('.'):
-        log.info(f"Ignoring hidden file: {filepath}")
-        return None
-    # --- END CORRECTION ---
+@functools.lru_cache(maxsize=None)
+def _get_loader(ext: str) -> type:
+    """Imports and returns the LangChain loader class registered for ext."""
+    module_name, class_name = SUPPORTED_EXTENSIONS[ext]
+    return getattr(importlib.import_module(module_name), class_name)
+
+PDF_PARALLEL_MIN_PAGES = 100
 
-    ext = os.path.splitext(filepath)[1].lower()
-    log.debug(f"File extension: '{ext}'")
 
-    if not ext: # Skip files with no extension
-         log.info(f"Ignoring file with no extension: {filepath}")
-         return None
+def _get_pdf_page_workers() -> int:
+    """Threads used per large PDF; DOC_PDF_PAGE_WORKERS (default 1 = sequential)."""
+    try:
+        return max(1, int(os.getenv("DOC_PDF_PAGE_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+def _extract_pdf_page_range(filepath: str, start: int, stop: int) -> List[str]:
+    """Extracts page texts [start, stop) with a reader private to the calling thread."""
+    from pypdf import PdfReader
+    reader = PdfReader(filepath, strict=False)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def _extract_pdf_pages(filepath: str, workers: Optional[int] = None) -> List[str]:
+    """Extracts non-empty page texts with pypdf directly, skipping LangChain Document wrapping.
+
+    PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split into contiguous
+    page ranges extracted on a thread pool when more than one worker is
+    configured. Each thread opens its own PdfReader, since a reader shares one
+    file stream and is not thread-safe; results are stitched in page order.
+    """
+    from pypdf import PdfReader
+    if workers is None:
+        workers = _get_pdf_page_workers()
+    reader = PdfReader(filepath, strict=False)
+    page_count = len(reader.pages)
+
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        page_texts = (page.extract_text() or "" for page in reader.pages)
+    else:
+        del reader
+        step = -(-page_count // workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_extract_pdf_page_range, filepath, start, min(start + step, page_count))
+                for start in range(0, page_count, step)
+            ]
+            page_texts = [text for future in futures for text in future.result()]
+    return [text for text in page_texts if text]
+
+def _extract_unstructured_elements(filepath: str) -> List[str]:
+    """Extracts element texts from Word/PowerPoint files via unstructured's partition, skipping LangChain."""
+    from unstructured.partition.auto import partition
+    elements = partition(filename=filepath, strategy="fast")
+    return [element.text for element in elements if getattr(element, 'text', None)]
+
+def extract_text_from_file(filepath: str) -> Tuple[Optional[List[str]], List[Tuple[int, str]]]:
+    """Loads a supported document file and extracts its text as a list of non-empty page/section strings.
+
+    Pages are returned unjoined so the caller can stream them to disk without
+    building one large intermediate string (see write_text_parts).
+    Runs in worker processes, so instead of logging it returns its log messages
+    as (level, message) pairs alongside the text, for the parent to emit.
+    """
+    notes: List[Tuple[int, str]] = []
+    filename = os.path.basename(filepath)
+    if filename.startswith('.'):
+        notes.append((logging.INFO, f"Ignoring hidden file: {filepath}"))
+        return None, notes
 
-    if ext in IGNORED_EXTENSIONS:
-        log.info(f"Ignoring file based on IGNORED_EXTENSIONS: {filepath}")
-        return None
+    _, dot, raw_ext = filename.rpartition('.')
+    ext = '.' + raw_ext.lower() if dot and raw_ext else ''
+    if not ext or ext in IGNORED_EXTENSIONS or ext not in _ALLOWED_EXTENSIONS:
+        notes.append((logging.INFO, f"Skipping file - no extension or no supported loader for '{ext}': {filepath}"))
+        return None, notes
 
-    loader_class = SUPPORTED_EXTENSIONS.get(ext)
-    if not loader_class:
-        log.info(f"Skipping file - no supported loader found for extension '{ext}': {filepath}")
-        return None
+    loader_name = SUPPORTED_EXTENSIONS[ext][1]
 
-    log.info(f"Processing: {filepath} using {loader_class.__name__}")
-    loaded_docs: List[Document] = []
+    notes.append((logging.INFO, f"Processing: {filepath} using {loader_name}"))
+    loaded_docs: List[Any] = []
+    text_parts: Optional[List[str]] = None
     try:
-        if loader_class == TextLoader:
+        if loader_name == "TextLoader":
+            TextLoader = _get_loader(ext)
             try:
                 loader_instance = TextLoader(filepath, encoding='utf-8')
                 loaded_docs = loader_instance.load()
-                log.debug(f"Loaded successfully with UTF-8.")
             except UnicodeDecodeError:
-                log.warning(f"UTF-8 decoding failed for {filepath}. Trying GBK...")
+                notes.append((logging.WARNING, f"UTF-8 decoding failed for {filepath}. Trying GBK..."))
                 try:
                     loader_instance = TextLoader(filepath, encoding='gbk')
                     loaded_docs = loader_instance.load()
-                    log.debug(f"Loaded successfully with GBK.")
+                    notes.append((logging.DEBUG, f"Loaded {filepath} successfully with GBK."))
                 except Exception as enc_e_gbk:
-                    log.warning(f"GBK decoding also failed for {filepath}: {enc_e_gbk}. Skipping file.")
-                    return None
+                    notes.append((logging.WARNING, f"GBK decoding also failed for {filepath}: {enc_e_gbk}. Skipping file."))
+                    return None, notes
             except Exception as load_e:
-                log.warning(f"Error loading {filepath} with TextLoader: {load_e}")
-                return None
-        elif loader_class in [UnstructuredWordDocumentLoader, UnstructuredPowerPointLoader]:
-            log.debug(f"Using Unstructured loader (mode=single) for: {filepath}")
-            loader_instance = loader_class(filepath, mode="single")
-            loaded_docs = loader_instance.load()
-            log.debug(f"Loaded successfully with {loader_class.__name__}.")
-        elif loader_class == PyPDFLoader:
-             log.debug(f"Using PyPDFLoader for: {filepath}")
-             loader_instance = PyPDFLoader(filepath, extract_images=False)
-             loaded_docs = loader_instance.load()
-             log.debug(f"Loaded successfully with PyPDFLoader.")
+                notes.append((logging.WARNING, f"Error loading {filepath} with TextLoader: {load_e}"))
+                return None, notes
+        elif loader_name in UNSTRUCTURED_LOADERS:
+            text_parts = _extract_unstructured_elements(filepath)
+        elif loader_name == "PyPDFLoader":
+            try:
+                text_parts = _extract_pdf_pages(filepath)
+            except Exception as pdf_e:
+                notes.append((logging.WARNING, f"pypdf extraction failed for {filepath} ({type(pdf_e).__name__}: {pdf_e}). Falling back to PyPDFLoader..."))
+                loader_instance = _get_loader(ext)(filepath, extract_images=False)
+                loaded_docs = loader_instance.load()
         else:
-            log.debug(f"Using generic loader {loader_class.__name__} for: {filepath}")
-            loader_instance = loader_class(filepath)
+            loader_instance = _get_loader(ext)(filepath)
             loaded_docs = loader_instance.load()
-            log.debug(f"Loaded successfully with {loader_class.__name__}.")
 
-        full_text = "\n\n".join([doc.page_content for doc in loaded_docs if doc.page_content])
-        if not full_text:
-             log.warning(f"Extraction resulted in empty text for: {filepath}")
-             return None
+        if text_parts is None:
+            text_parts = [doc.page_content for doc in loaded_docs if doc.page_content]
+        if not text_parts:
+             notes.append((logging.WARNING, f"Extraction resulted in empty text for: {filepath}"))
+             return None, notes
 
-        log.info(f"Successfully extracted text from {filepath} (Length: {len(full_text)})")
-        return full_text
+        notes.append((logging.INFO, f"Successfully extracted text from {filepath} (Parts: {len(text_parts)}, Length: {sum(map(len, text_parts))})"))
+        return text_parts, notes
 
     except ImportError as ie:
-        log.error(f"ImportError processing {filepath} with {loader_class.__name__}. A dependency might be missing: {ie}")
-        log.debug(traceback.format_exc())
-        return None
+        notes.append((logging.ERROR, f"ImportError processing {filepath} with {loader_name}. A dependency might be missing: {ie}"))
+        notes.append((logging.DEBUG, f"Traceback for {filepath}:\n{traceback.format_exc()}"))
+        return None, notes
     except FileNotFoundError:
-        log.error(f"File not found during processing (should not happen if glob worked): {filepath}")
-        return None
+        notes.append((logging.ERROR, f"File not found during processing (should not happen if glob worked): {filepath}"))
+        return None, notes
     except IsADirectoryError:
-         log.warning(f"Attempted to load a directory as a file: {filepath}")
-         return None
+         notes.append((logging.WARNING, f"Attempted to load a directory as a file: {filepath}"))
+         return None, notes
+    except Exception as e:
+        notes.append((logging.ERROR, f"!!! Unexpected Error processing {filepath} with {loader_name}: {type(e).__name__} - {e}"))
+        notes.append((logging.DEBUG, f"Traceback for {filepath}:\n{traceback.format_exc()}"))
+        return None, notes
+
+
+WRITE_BUFFER_SIZE = 1 << 20
+PART_SEPARATOR = b"\n\n"
+
+
+def write_text_parts(output_filepath: str, text_parts: List[str]):
+    """Streams text parts to output_filepath as UTF-8, separated by blank lines, through a 1 MiB buffer.
+
+    Writes to a temp file and swaps it into place, so an output hardlinked by
+    _reuse_output gets a new inode instead of overwriting every linked copy.
+    """
+    tmp_path = output_filepath + ".tmp"
+    try:
+        with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            for i, part in enumerate(text_parts):
+                if i:
+                    f.write(PART_SEPARATOR)
+                f.write(part.encode('utf-8', errors='replace'))
+        os.replace(tmp_path, output_filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+WRITE_QUEUE_SIZE = 32
+
+
+def _write_worker(write_queue: "queue.Queue", written_files: List[str], failed_files: List[str]):
+    """Writer thread: drains (filepath, output_filepath, text_parts) items until a None sentinel."""
+    while True:
+        item = write_queue.get()
+        if item is None:
+            break
+        filepath, output_filepath, text_parts = item
+        try:
+            write_text_parts(output_filepath, text_parts)
+            log.info(f"Successfully saved text to: {output_filepath}")
+            written_files.append(filepath)
+        except IOError as e:
+            log.error(f"Failed to write text file {output_filepath}: {e}")
+            failed_files.append(filepath)
+        except Exception as e:
+            log.error(f"Unexpected error writing file {output_filepath}: {e}")
+            failed_files.append(filepath)
+
+
+CACHE_FILENAME = "convert_cache.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def _load_cache(output_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Loads the conversion fingerprint cache from output_dir (empty on any error)."""
+    cache_path = os.path.join(output_dir, CACHE_FILENAME)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
     except Exception as e:
-        log.error(f"!!! Unexpected Error processing {filepath} with {loader_class.__name__}: {type(e).__name__} - {e}")
-        log.debug(traceback.format_exc())
-        return None
+        log.warning(f"Could not read conversion cache {cache_path}, starting fresh: {e}")
+        return {}
+
+
+def _save_cache(output_dir: str, cache: Dict[str, Dict[str, Any]]):
+    """Persists the fingerprint cache atomically (write temp file, then os.replace)."""
+    cache_path = os.path.join(output_dir, CACHE_FILENAME)
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        log.error(f"Failed to save conversion cache {cache_path}: {e}")
+
 
+def _file_digest(filepath: str) -> str:
+    """Content fingerprint of a file (BLAKE2b, streamed in 1 MiB chunks)."""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
-def convert_directory_to_txt(input_dir: str, output_dir: str):
-    """Converts documents to text."""
+
+def _reuse_output(source_path: str, output_filepath: str) -> bool:
+    """Hardlinks (or copies) an existing .txt output to output_filepath."""
+    if os.path.abspath(source_path) == os.path.abspath(output_filepath):
+        return True
+    try:
+        if os.path.exists(output_filepath):
+            os.remove(output_filepath)
+        try:
+            os.link(source_path, output_filepath)
+        except OSError:
+            shutil.copyfile(source_path, output_filepath)
+        return True
+    except OSError as e:
+        log.warning(f"Could not reuse cached output {source_path} for {output_filepath}: {e}")
+        return False
+
+
+def _iter_candidates(root_dir: str) -> Iterator[str]:
+    """Yields paths of non-hidden files with a supported extension under root_dir.
+
+    Uses an explicit stack of os.scandir iterators so name checks work on
+    DirEntry.name and directory/file type checks reuse the cached d_type
+    instead of separate stat calls. Hidden directories are not descended.
+    """
+    stack = [root_dir]
+    while stack:
+        current_dir = stack.pop()
+        log.debug("Scanning directory: %s", current_dir)
+        try:
+            with os.scandir(current_dir) as it:
+                for entry in it:
+                    name = entry.name
+                    if name[0] == '.':
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    _, dot, raw_ext = name.rpartition('.')
+                    if dot and raw_ext.lower() in _SUPPORTED_EXT_NAMES and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            log.warning(f"Could not scan directory {current_dir}: {e}")
+
+
+def _get_worker_count() -> int:
+    """Number of extraction processes; override with DOC_CONVERT_WORKERS."""
+    env_value = os.getenv("DOC_CONVERT_WORKERS")
+    if env_value:
+        try:
+            return max(1, int(env_value))
+        except ValueError:
+            log.warning(f"Invalid DOC_CONVERT_WORKERS value '{env_value}', using default.")
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _get_mp_context():
+    """Multiprocessing context for the extraction pool.
+
+    On Linux workers are forked so they inherit the parent's already-imported
+    modules copy-on-write instead of re-importing everything. Windows and macOS
+    keep spawn, where the lazy loader imports keep worker startup cheap.
+    """
+    if sys.platform.startswith("linux"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def convert_directory_to_txt(input_dir: str, output_dir: str, force: bool = False):
+    """Converts documents to text.
+
+    Unchanged files (same size/mtime, or same content hash) are skipped using
+    the fingerprint cache in output_dir unless force is True.
+    """
     if not os.path.isdir(input_dir):
         log.error(f"Input directory not found: {input_dir}")
         return
@@ -141,52 +350,111 @@ def convert_directory_to_txt(input_dir: str, output_dir: str):
     log.info(f"Starting conversion from '{input_dir}' to text files in '{output_dir}'")
 
     processed_files = 0
+    cached_files = 0
     failed_files = 0
     skipped_files = 0
-    files_encountered = 0
-
-    for root, dirs, files in os.walk(input_dir):
-        log.debug(f"Scanning directory: {root}")
-        # Skip specific subdirectories if needed (e.g., '.git')
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
-
-        for filename in files:
-            files_encountered += 1
-            filepath = os.path.join(root, filename)
-            extracted_text = extract_text_from_file(filepath)
-
-            if extracted_text is not None:
-                base_filename = os.path.basename(filepath)
-                output_filename = f"{base_filename}.txt"
-                output_filepath = os.path.join(output_dir, output_filename)
 
+    # Collect candidate files up-front so hidden or unsupported files never reach the workers
+    all_files: List[str] = list(_iter_candidates(input_dir))
+    files_encountered = len(all_files)
+
+    cache = {} if force else _load_cache(output_dir)
+    outputs_by_digest = {
+        entry["digest"]: entry["output"] for entry in cache.values()
+        if entry.get("digest") and entry.get("output") and os.path.exists(entry["output"])
+    }
+
+    # Resolve cache hits in the parent; only real work is sent to the pool
+    pending_files: List[str] = []
+    fingerprints: Dict[str, Dict[str, Any]] = {}
+    for filepath in all_files:
+        output_filepath = os.path.join(output_dir, f"{os.path.basename(filepath)}.txt")
+        try:
+            st = os.stat(filepath)
+        except OSError as e:
+            log.warning(f"Could not stat {filepath}: {e}")
+            pending_files.append(filepath)
+            continue
+
+        entry = cache.get(filepath)
+        if (entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+                and entry.get("output") == output_filepath and os.path.exists(output_filepath)):
+            log.debug("Unchanged since last run, skipping: %s", filepath)
+            cached_files += 1
+            continue
+
+        try:
+            digest = _file_digest(filepath)
+        except OSError as e:
+            log.warning(f"Could not hash {filepath}: {e}")
+            pending_files.append(filepath)
+            continue
+
+        fingerprint = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest, "output": output_filepath}
+        cached_output = outputs_by_digest.get(digest)
+        if cached_output and _reuse_output(cached_output, output_filepath):
+            log.info(f"Content unchanged, reused cached text for: {filepath}")
+            cache[filepath] = fingerprint
+            cached_files += 1
+            continue
+
+        fingerprints[filepath] = fingerprint
+        pending_files.append(filepath)
+
+    max_workers = _get_worker_count()
+    log.info(f"Extracting text from {len(pending_files)} files using {max_workers} worker process(es)...")
+
+    # Extraction (process pool) and writing (one thread) run as a pipeline, so
+    # results are consumed in completion order while slow writes drain in the background
+    write_queue: "queue.Queue" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    written: List[str] = []
+    write_failed: List[str] = []
+    writer = threading.Thread(
+        target=_write_worker, args=(write_queue, written, write_failed), name="DocConverterWriter", daemon=True
+    )
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_get_mp_context()) as executor:
+            # With the fork context all workers are forked on the first submit, so the
+            # writer thread starts afterwards and children never inherit a running thread
+            futures = {executor.submit(extract_text_from_file, filepath): filepath for filepath in pending_files}
+            writer.start()
+            for future in as_completed(futures):
+                filepath = futures[future]
                 try:
-                    # --- OLD CODE ---
-                    # with open(output_filepath, 'w', encoding='utf-8') as f:
-                    #    f.write(extracted_text)
-                    # --- END OLD CODE ---
-
-                    # --- NEW CODE ---
-                    with open(output_filepath, 'w', encoding='utf-8', errors='replace') as f:
-                        f.write(extracted_text)
-                    # --- END NEW CODE ---
-
-                    log.info(f"Successfully saved text to: {output_filepath}")
-                    processed_files += 1
-                except IOError as e:
-                    log.error(f"Failed to write text file {output_filepath}: {e}")
-                    failed_files += 1
+                    text_parts, notes = future.result()
                 except Exception as e:
-                    log.error(f"Unexpected error writing file {output_filepath}: {e}")
+                    log.error(f"Worker failed while extracting {filepath}: {type(e).__name__} - {e}")
                     failed_files += 1
-            else:
-                skipped_files += 1
-
+                    continue
+                # Workers don't log themselves; emit their messages here, in the parent
+                for level, message in notes:
+                    log.log(level, message)
+                if text_parts is not None:
+                    output_filepath = os.path.join(output_dir, f"{os.path.basename(filepath)}.txt")
+                    write_queue.put((filepath, output_filepath, text_parts))
+                else:
+                    skipped_files += 1
+    finally:
+        if writer.is_alive():
+            write_queue.put(None)
+            writer.join()
+
+    processed_files += len(written)
+    failed_files += len(write_failed)
+    for filepath in written:
+        if filepath in fingerprints:
+            cache[filepath] = fingerprints[filepath]
+
+    # Drop entries for files that no longer exist in the input tree
+    current_files = set(all_files)
+    cache = {path: entry for path, entry in cache.items() if path in current_files}
+    _save_cache(output_dir, cache)
 
     log.info("--- Conversion Summary ---")
     log.info(f"Successfully Converted: {processed_files}")
+    log.info(f"Unchanged (cached):     {cached_files}")
     log.info(f"Failed/Skipped:        {failed_files + skipped_files}")
-    log.info(f"Total Files Encountered:{files_encountered}")
+    log.info(f"Supported Files Found:  {files_encountered}")
     log.info(f"Text files saved in:   {output_dir}")
     log.info("--------------------------")
 
@@ -195,6 +463,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert various document types (PDF, DOCX, PPTX, TXT, MD) in a directory to plain TXT files.")
     parser.add_argument("--input-dir", required=True, help="Directory containing the original documents to convert.")
     parser.add_argument("--output-dir", required=True, help="Directory where the converted .txt files will be saved.")
+    parser.add_argument("--force", action="store_true", help="Ignore the conversion cache and re-extract every file.")
 
     args = parser.parse_args()
 
@@ -203,4 +472,4 @@ if __name__ == "__main__":
     log.info(f"Using Input Directory: {input_path}")
     log.info(f"Using Output Directory: {output_path}")
 
-    convert_directory_to_txt(input_path, output_path)
\ No newline at end of file
+    convert_directory_to_txt(input_path, output_path, force=args.force)
\ No newline at end of file
@@ -3,13 +3,16 @@
 import os
 import logging
 import asyncio
+import functools
+import gc
 import yaml
 import traceback
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncGenerator
 
 # --- Third-party Imports ---
 import pandas as pd
+import pyarrow.parquet as pq
 import tiktoken
 import lancedb
 
@@ -63,6 +66,35 @@ TEXT_UNIT_TABLE = "text_units.parquet"
 COMMUNITY_TABLE = "communities.parquet"
 COVARIATE_TABLE = "claims.parquet"
 
+ENTITY_PATH = os.path.join(OUTPUT_DIR, ENTITY_TABLE)
+COMMUNITY_PATH = os.path.join(OUTPUT_DIR, COMMUNITY_TABLE)
+RELATIONSHIP_PATH = os.path.join(OUTPUT_DIR, RELATIONSHIP_TABLE)
+COMMUNITY_REPORT_PATH = os.path.join(OUTPUT_DIR, COMMUNITY_REPORT_TABLE)
+TEXT_UNIT_PATH = os.path.join(OUTPUT_DIR, TEXT_UNIT_TABLE)
+COVARIATE_PATH = os.path.join(OUTPUT_DIR, COVARIATE_TABLE)
+REQUIRED_TABLES = (ENTITY_TABLE, RELATIONSHIP_TABLE, TEXT_UNIT_TABLE, COMMUNITY_TABLE, COMMUNITY_REPORT_TABLE)
+
+# Columns consumed by the read_indexer_* adapters / local search context builder.
+# Large columns the query path never touches (layout coordinates, report JSON,
+# community membership lists other than entity_ids) are not loaded at all.
+ENTITY_COLS = (
+    "id", "human_readable_id", "title", "type", "description", "text_unit_ids",
+    "degree", "rank", "description_embedding",
+)
+COMMUNITY_COLS = ("id", "human_readable_id", "community", "level", "parent", "title", "entity_ids")
+RELATIONSHIP_COLS = (
+    "id", "human_readable_id", "source", "target", "description", "weight",
+    "combined_degree", "rank", "text_unit_ids",
+)
+COMMUNITY_REPORT_COLS = (
+    "id", "human_readable_id", "community", "level", "parent", "title", "summary",
+    "full_content", "rank", "full_content_embedding",
+)
+TEXT_UNIT_COLS = (
+    "id", "human_readable_id", "text", "n_tokens", "document_ids", "entity_ids",
+    "relationship_ids", "covariate_ids",
+)
+
 _settings_path = os.path.join(GRAPHRAG_ROOT_DIR, "settings.yaml")
 _llm_config = {}
 _embedding_config = {}
@@ -98,7 +130,15 @@ _search_engine: Optional[LocalSearch] = None
 _initialized: bool = False
 _lock = asyncio.Lock()
 
+# Optional cache of Parquet frames, keyed by path and validated by (mtime_ns, size, columns).
+# initialize_rag only runs once per process (from the app lifespan), so by default nothing
+# would ever hit it and it would just pin every frame, embeddings included, for the life of
+# the process. Off unless GRAPHRAG_PARQUET_CACHE=true for a setup that re-initializes in-process.
+PARQUET_CACHE_ENABLED = os.getenv("GRAPHRAG_PARQUET_CACHE", "false").lower() == "true"
+_parquet_cache: Dict[str, Tuple[int, int, Optional[tuple], pd.DataFrame]] = {}
+
 # --- Helper Functions ---
+@functools.lru_cache(maxsize=32)
 def _resolve_api_key(key_value: Optional[str]) -> Optional[str]:
     if key_value and key_value.startswith("${") and key_value.endswith("}"):
         var_name = key_value[2:-1]
@@ -111,6 +151,48 @@ def _resolve_api_key(key_value: Optional[str]) -> Optional[str]:
          return direct_env_key
     return key_value
 
+def _read_parquet(path: str, columns: Optional[tuple] = None) -> pd.DataFrame:
+    """Reads a Parquet table via pyarrow, loading only the wanted columns that exist in the file.
+
+    Unchanged files are served from _parquet_cache. Callers get a shallow copy
+    so column reassignments in the indexer adapters don't leak into the cache.
+    """
+    st = os.stat(path)
+    hit = _parquet_cache.get(path)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size and hit[2] == columns:
+        log.info(f"Reusing cached Parquet data for unchanged file: {path}")
+        return hit[3].copy(deep=False)
+
+    wanted_columns = columns
+    if wanted_columns is not None:
+        available = set(pq.read_schema(path).names)
+        wanted_columns = [c for c in wanted_columns if c in available]
+    table = pq.read_table(path, columns=wanted_columns, use_threads=True)
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    if PARQUET_CACHE_ENABLED:
+        _parquet_cache[path] = (st.st_mtime_ns, st.st_size, columns, df)
+        return df.copy(deep=False)
+    return df
+
+def _list_output_files() -> set:
+    """Names of regular files in OUTPUT_DIR, gathered with a single directory scan."""
+    try:
+        with os.scandir(OUTPUT_DIR) as it:
+            return {entry.name for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+@functools.lru_cache(maxsize=4)
+def _get_encoder(name: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoder for name, cached so re-initialization doesn't reload BPE tables."""
+    try:
+        encoder = tiktoken.encoding_for_model(name)
+        log.info(f"Using token encoder: {name}")
+        return encoder
+    except Exception as e:
+        log.warning(f"Failed to get tiktoken encoder for '{name}', falling back to 'cl100k_base'. Error: {e}")
+        return tiktoken.get_encoding("cl100k_base")
+
 # --- Initialization Function ---
 async def initialize_rag():
     global _model_manager, _search_engine, _initialized
@@ -123,36 +205,53 @@ async def initialize_rag():
 
         log.info("--- Initializing GraphRAG Local Search Engine ---")
         try:
-            required_files = [ENTITY_TABLE, RELATIONSHIP_TABLE, TEXT_UNIT_TABLE, COMMUNITY_TABLE, COMMUNITY_REPORT_TABLE]
-            missing_files = [f for f in required_files if not os.path.exists(os.path.join(OUTPUT_DIR, f))]
+            present_files = _list_output_files()
+            missing_files = [f for f in REQUIRED_TABLES if f not in present_files]
             if missing_files:
                  log.error(f"Missing required GraphRAG output files in {OUTPUT_DIR}: {missing_files}")
                  log.error("Please run the 'graphrag index' command first.")
                  return
 
             log.info("Loading GraphRAG data from Parquet files...")
-            entity_df = pd.read_parquet(os.path.join(OUTPUT_DIR, ENTITY_TABLE))
-            community_df = pd.read_parquet(os.path.join(OUTPUT_DIR, COMMUNITY_TABLE))
-            relationship_df = pd.read_parquet(os.path.join(OUTPUT_DIR, RELATIONSHIP_TABLE))
-            report_df = pd.read_parquet(os.path.join(OUTPUT_DIR, COMMUNITY_REPORT_TABLE))
-            text_unit_df = pd.read_parquet(os.path.join(OUTPUT_DIR, TEXT_UNIT_TABLE))
+            has_covariates = COVARIATE_TABLE in present_files
+            # Read all tables concurrently in worker threads (disk I/O + Arrow decode overlap)
+            load_tasks = [
+                asyncio.to_thread(_read_parquet, path, columns)
+                for path, columns in (
+                    (ENTITY_PATH, ENTITY_COLS),
+                    (COMMUNITY_PATH, COMMUNITY_COLS),
+                    (RELATIONSHIP_PATH, RELATIONSHIP_COLS),
+                    (COMMUNITY_REPORT_PATH, COMMUNITY_REPORT_COLS),
+                    (TEXT_UNIT_PATH, TEXT_UNIT_COLS),
+                )
+            ]
+            if has_covariates:
+                load_tasks.append(asyncio.to_thread(_read_parquet, COVARIATE_PATH))
+            loaded_dfs = await asyncio.gather(*load_tasks)
+            entity_df, community_df, relationship_df, report_df, text_unit_df = loaded_dfs[:5]
+            covariate_df = loaded_dfs[5] if has_covariates else None
+            del loaded_dfs
 
             covariates = None
-            covariate_path = os.path.join(OUTPUT_DIR, COVARIATE_TABLE)
-            if os.path.exists(covariate_path):
+            if covariate_df is not None:
                 log.info("Loading covariates (claims)...")
-                covariate_df = pd.read_parquet(covariate_path)
                 claims = read_indexer_covariates(covariate_df)
+                del covariate_df
                 covariates = {"claims": claims}
                 log.info(f"Loaded {len(claims)} claim records.")
             else:
                 log.warning(f"Covariate file '{COVARIATE_TABLE}' not found in {OUTPUT_DIR}. Skipping claims loading.")
 
             log.info("Converting DataFrames to GraphRAG objects...")
+            # Drop each DataFrame as soon as it has been converted; the search engine only keeps the derived objects
             entities = read_indexer_entities(entity_df, community_df, COMMUNITY_LEVEL)
+            del entity_df
             relationships = read_indexer_relationships(relationship_df)
+            del relationship_df
             reports = read_indexer_reports(report_df, community_df, COMMUNITY_LEVEL)
+            del report_df, community_df
             text_units = read_indexer_text_units(text_unit_df)
+            del text_unit_df
             log.info(f"Loaded: {len(entities)} entities, {len(relationships)} relationships, {len(reports)} reports, {len(text_units)} text units.")
 
             log.info(f"Connecting to LanceDB vector store at: {LANCEDB_URI}")
@@ -211,13 +310,9 @@ async def initialize_rag():
             )
 
             # Token Encoder
-            try:
-                 token_encoder = tiktoken.encoding_for_model(LLM_ENCODING_MODEL)
-                 log.info(f"Using token encoder: {LLM_ENCODING_MODEL}")
-            except Exception as e:
-                 log.warning(f"Failed to get tiktoken encoder for '{LLM_ENCODING_MODEL}', falling back to 'cl100k_base'. Error: {e}")
-                 token_encoder = tiktoken.get_encoding("cl100k_base")
+            token_encoder = _get_encoder(LLM_ENCODING_MODEL)
 
+            gc.collect()
             log.info("Creating Local Search Context Builder...")
             context_builder = LocalSearchMixedContext(
                 community_reports=reports, text_units=text_units, entities=entities,
@@ -268,51 +363,91 @@ async def initialize_rag():
             _initialized = False
 
 # --- Query Function ---
-async def query_rag(question: str, chat_history: Optional[List[Dict]] = None) -> str:
+async def query_rag_stream(question: str, chat_history: Optional[List[Dict]] = None) -> AsyncGenerator[str, None]:
+    """Queries GraphRAG Local Search, yielding the answer as text deltas while the LLM generates it.
+
+    Search/LLM errors propagate to the caller, so a failure after partial output
+    is reported as a failure rather than as part of the answer.
+    """
     if not _initialized or not _search_engine:
         log.error("GraphRAG search engine is not initialized. Cannot query.")
-        return "知识库引擎尚未初始化，请稍后重试或检查启动日志。(Knowledge base engine not initialized. Please try again later or check startup logs.)"
+        yield "知识库引擎尚未初始化，请稍后重试或检查启动日志。(Knowledge base engine not initialized. Please try again later or check startup logs.)"
+        return
 
-    log.info(f"--- Querying GraphRAG (Local Search) ---")
-    log.info(f"Query: '{question}'")
+    log.debug("--- Streaming GraphRAG query (Local Search) ---")
+    log.debug("Query: '%s'", question)
 
-    try:
-        result = await _search_engine.search(query=question)
-        if result and hasattr(result, 'response') and result.response:
-            log.info(f"GraphRAG response received, length: {len(result.response)}")
-            return result.response
-        else:
-            log.warning(f"GraphRAG query returned no response or unexpected result format: {result}")
-            return "抱歉，未能从知识库中找到明确的答案。(Sorry, could not find a clear answer in the knowledge base.)"
+    received = 0
+    async for delta in _search_engine.stream_search(query=question):
+        # Some GraphRAG versions yield the context records before the first token
+        if not isinstance(delta, str) or not delta:
+            continue
+        received += len(delta)
+        yield delta
 
-    except Exception as e:
-        log.exception("!!! ERROR during GraphRAG local search query !!!")
-        return f"查询知识库时遇到错误，请稍后再试。(Error querying the knowledge base, please try again later.) Details: {type(e).__name__}"
+    if received:
+        log.debug("GraphRAG streamed response complete, length: %s", received)
+    else:
+        log.warning("GraphRAG stream returned no response.")
+        yield "抱歉，未能从知识库中找到明确的答案。(Sorry, could not find a clear answer in the knowledge base.)"
 
 # --- Ingestion Trigger (Using CLI) ---
+SUBPROCESS_LINE_LIMIT = 1 << 20
+
+async def _pump_stream(stream: Optional[asyncio.StreamReader], level: int, prefix: str):
+    """Logs each line from a subprocess pipe at the given level until EOF.
+
+    A line longer than SUBPROCESS_LINE_LIMIT is logged in limit-sized pieces
+    instead of aborting, so the pipe keeps draining and the child never blocks on it.
+    """
+    if stream is None:
+        return
+    while True:
+        try:
+            line = await stream.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            line = e.partial  # EOF; last line may lack a newline
+            if not line:
+                break
+        except asyncio.LimitOverrunError as e:
+            line = await stream.read(e.consumed)
+        text = line.decode(errors='ignore').rstrip()
+        if text:
+            log.log(level, f"{prefix}: {text}")
+
 async def trigger_ingestion():
     global _initialized, _search_engine
     log.info("--- Triggering GraphRAG Indexing via CLI ---")
     _initialized = False
     _search_engine = None
+    _resolve_api_key.cache_clear()  # Re-read API key env vars on the next initialization
     log.info("Search engine state reset. Will re-initialize after indexing and on next query/restart.")
     try:
         cmd = ["graphrag", "index", "--root", GRAPHRAG_ROOT_DIR]
         log.info(f"Executing command: {' '.join(cmd)}")
         process = await asyncio.create_subprocess_exec(
-            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, limit=SUBPROCESS_LINE_LIMIT
         )
-        stdout, stderr = await process.communicate()
+        try:
+            # Forward output line by line as it arrives instead of buffering it all in memory
+            await asyncio.gather(
+                _pump_stream(process.stdout, logging.INFO, "GraphRAG STDOUT"),
+                _pump_stream(process.stderr, logging.WARNING, "GraphRAG STDERR"),
+            )
+            await process.wait()
+        finally:
+            # If pumping failed (or we were cancelled), don't leave the child running on unread pipes
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                await process.wait()
         log.info("GraphRAG CLI process finished.")
-        stdout_decoded = stdout.decode(errors='ignore') if stdout else ""
-        stderr_decoded = stderr.decode(errors='ignore') if stderr else ""
-        if stdout_decoded: log.info(f"GraphRAG STDOUT:\n{stdout_decoded}")
         if process.returncode != 0:
-            if stderr_decoded: log.error(f"GraphRAG STDERR:\n{stderr_decoded}")
             log.error(f"GraphRAG indexing command failed with return code {process.returncode}")
             raise RuntimeError(f"GraphRAG indexing failed. Check logs above.")
         else:
-            if stderr_decoded: log.info(f"GraphRAG STDERR (Return Code 0):\n{stderr_decoded}")
             log.info("--- GraphRAG Indexing Completed Successfully via CLI ---")
     except FileNotFoundError:
         log.error("ERROR: 'graphrag' command not found. Is GraphRAG installed and in the system PATH?")
@@ -6,22 +6,135 @@ from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 import graphrag_processor # Using the new processor
 import storage
-from models import ChatRequest, ChatResponse, Message, NewTopicRequest, TopicInfo, Topic
-from typing import List, Dict
+from models import Message, NewTopicRequest, PostMessageRequest, TopicInfo, Topic
+from typing import List, Dict, Any, AsyncGenerator, Optional
 import os
 import uvicorn
 import asyncio
-import traceback # For detailed error logging
-import json
+import time
+import orjson
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# --- Logging Setup ---
+# Records are queued by the request path and written to the console on a listener thread,
+# so handlers never block the event loop. LOG_LEVEL=WARNING (or ERROR) quiets production.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+def _setup_logging():
+    """Routes root logging through a QueueHandler; a no-op if that is already done.
+
+    `python main.py` imports this module twice (as __main__ and as main via
+    uvicorn), and the second import must not wrap the existing QueueHandler.
+    """
+    root_logger = logging.getLogger()
+    if any(isinstance(h, QueueHandler) for h in root_logger.handlers):
+        return
+    handlers = root_logger.handlers[:] or [logging.StreamHandler()]
+    for handler in handlers:
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root_logger.handlers = [QueueHandler(log_queue)]
+    level = logging.getLevelName(LOG_LEVEL)
+    root_logger.setLevel(level if isinstance(level, int) else logging.INFO)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    if not isinstance(level, int):
+        root_logger.warning(f"Unknown LOG_LEVEL '{LOG_LEVEL}', using INFO.")
+
+_setup_logging()
+log = logging.getLogger(__name__)
+# --- End Logging Setup ---
 
 # --- Application Lifecycle ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Application starting up...")
+    log.info("Application starting up...")
     # Initialize GraphRAG Local Search Engine during startup
     await graphrag_processor.initialize_rag()
     yield
-    print("Application shutting down...")
+    log.info("Application shutting down...")
+
+def _sse_frame(payload: Dict[str, Any]) -> bytes:
+    """Encodes one SSE data frame; orjson returns UTF-8 bytes, so Starlette sends them as-is."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+STREAM_ERROR_MESSAGE = "抱歉，处理您的请求时发生内部错误。(Sorry, an internal error occurred while processing your request.)"
+
+# chunk 帧是最热的路径：固定的前后缀预先序列化，每帧只编码变化的 content 字符串
+_CHUNK_FRAME_PREFIX = b'data: {"type":"chunk","content":'
+_CHUNK_FRAME_SUFFIX = b'}\n\n'
+
+def _sse_chunk_frame(content: str) -> bytes:
+    """Same bytes as _sse_frame({"type": "chunk", "content": content}), without building a dict per frame."""
+    return _CHUNK_FRAME_PREFIX + orjson.dumps(content) + _CHUNK_FRAME_SUFFIX
+
+# 多个 SSE 帧合并为一次 ASGI body 消息：缓冲满 SSE_FLUSH_BYTES 字节，或最早的帧已缓冲 SSE_FLUSH_INTERVAL 秒即发送
+SSE_FLUSH_BYTES = 4096
+SSE_FLUSH_INTERVAL = 0.05
+
+SSE_FRAME_QUEUE_SIZE = 64
+_STREAM_END = object()
+
+async def _batch_sse_frames(frames: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """Coalesces SSE frames into fewer, larger writes; whatever is buffered is sent when the stream ends.
+
+    The inner generator runs start to finish in one producer task feeding a queue
+    (so contextvars, timeouts and cancel scopes held across its yields stay in one
+    task), and the next frame is awaited with the remaining flush timeout, so a
+    buffered frame goes out after at most SSE_FLUSH_INTERVAL even while the
+    producer (e.g. a slow LLM) has nothing new yet.
+    """
+    frame_queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=SSE_FRAME_QUEUE_SIZE)
+
+    async def produce():
+        try:
+            async for frame in frames:
+                await frame_queue.put(frame)
+        except Exception as e:
+            await frame_queue.put(e)  # 交给消费端重新抛出
+            return
+        finally:
+            await frames.aclose()
+        await frame_queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+    buf = bytearray()
+    flush_at = 0.0
+    try:
+        while True:
+            if buf:
+                try:
+                    item = await asyncio.wait_for(frame_queue.get(), max(0.0, flush_at - time.monotonic()))
+                except asyncio.TimeoutError:
+                    # 超时：先发出已缓冲的帧，再继续等待下一帧
+                    yield bytes(buf)
+                    buf.clear()
+                    continue
+            else:
+                item = await frame_queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                if buf:
+                    yield bytes(buf)
+                raise item
+            if not buf:
+                flush_at = time.monotonic() + SSE_FLUSH_INTERVAL
+            buf += item
+            if len(buf) >= SSE_FLUSH_BYTES:
+                yield bytes(buf)
+                buf.clear()
+        if buf:
+            yield bytes(buf)
+    finally:
+        # 客户端断开等情况：取消生产者并等待它结束（其 finally 会关闭底层生成器）
+        producer.cancel()
+        await asyncio.wait({producer})
 
 app = FastAPI(lifespan=lifespan, title="AI Study Assistant (GraphRAG Local Search)", version="1.2.0")
 
@@ -38,8 +151,8 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"], # Explicitly list allowed methods
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE", "OPTIONS"], # Only the methods the API exposes
+    allow_headers=["Content-Type", "Authorization"], # Explicit list: static preflight reply, no header echoing
 )
 
 # --- API Endpoints ---
@@ -53,7 +166,7 @@ async def health_check():
 @app.post("/api/ingest", status_code=status.HTTP_202_ACCEPTED)
 async def trigger_ingestion_endpoint(request: Request):
     """Manually triggers the GraphRAG document ingestion process via CLI."""
-    print("Received request to trigger GraphRAG ingestion via CLI...")
+    log.info("Received request to trigger GraphRAG ingestion via CLI...")
     try:
         # Run the CLI indexing in the background (fire and forget for the API response)
         # The actual indexing can take a long time.
@@ -62,103 +175,78 @@ async def trigger_ingestion_endpoint(request: Request):
         return {"message": "GraphRAG indexing process started in background via CLI. Engine will reload data on next query/restart after completion."}
 
     except RuntimeError as re:
-        print(f"Error during manual ingestion trigger: {re}")
+        log.error(f"Error during manual ingestion trigger: {re}")
         raise HTTPException(status_code=400, detail=str(re)) # Bad request if command not found etc.
     except Exception as e:
-        print(f"Error during manual ingestion trigger: {e}")
-        traceback.print_exc()
+        log.exception(f"Error during manual ingestion trigger: {e}")
         raise HTTPException(status_code=500, detail=f"Ingestion trigger failed: {str(e)}")
 
 
 # --- Topic Endpoints (No changes needed from previous version) ---
 @app.get("/api/topics", response_model=List[TopicInfo])
 async def get_topics():
-    try: return storage.list_topics()
-    except Exception as e: print(f"Error listing topics: {e}"); raise HTTPException(status_code=500, detail="Could not retrieve topics.")
+    try: return await storage.alist_topics()
+    except Exception as e: log.exception(f"Error listing topics: {e}"); raise HTTPException(status_code=500, detail="Could not retrieve topics.")
 
 @app.post("/api/topics", response_model=Topic, status_code=status.HTTP_201_CREATED)
 async def create_topic(request: NewTopicRequest):
-    try: return storage.create_new_topic(request.name)
-    except Exception as e: print(f"Error creating topic: {e}"); raise HTTPException(status_code=500, detail="Could not create new topic.")
+    try: return await storage.acreate_new_topic(request.name)
+    except Exception as e: log.exception(f"Error creating topic: {e}"); raise HTTPException(status_code=500, detail="Could not create new topic.")
 
 @app.get("/api/topics/{topic_id}", response_model=Topic)
 async def get_topic_history(topic_id: str):
-    topic = storage.load_topic(topic_id)
+    topic = await storage.aload_topic(topic_id)
     if topic is None: raise HTTPException(status_code=404, detail="Topic not found.")
     return topic
 
-# --- Message Endpoint (Using new query_rag) ---
+# --- Message Endpoint (Streaming via query_rag_stream) ---
 @app.post("/api/topics/{topic_id}/messages")
-async def post_message(topic_id: str, request: Request):
+async def post_message(topic_id: str, body: PostMessageRequest):
     """Handles a new user message, gets AI response using GraphRAG Local Search."""
-    try:
-        body = await request.json()
-        user_message_content = body.get("message")
-        if not user_message_content: raise HTTPException(status_code=400, detail="Missing 'message' field in request body.")
-    except Exception as e: print(f"Error reading request body: {e}"); raise HTTPException(status_code=400, detail=f"Invalid request body: {e}")
+    # 请求体由 FastAPI/pydantic 解析并校验（缺少或为空的 message 直接返回 422）
+    user_message_content = body.message
 
-    print(f"Received message for topic {topic_id}: {user_message_content}")
+    log.debug("Received message for topic %s: %s", topic_id, user_message_content)
 
-    topic = storage.load_topic(topic_id)
+    topic = await storage.aload_topic(topic_id)
     if topic is None: raise HTTPException(status_code=404, detail="Topic not found.")
 
-    user_message = Message(role="user", content=user_message_content)
-    storage.add_message_to_topic(topic_id, user_message)  # 立即保存用户消息
+    user_message = Message.model_construct(role="user", content=user_message_content)  # content 已由 PostMessageRequest 校验
+    await storage.aadd_message_to_topic(topic_id, user_message)  # 立即保存用户消息
     
     # 定义流式生成响应的异步函数
-    async def stream_response():
+    async def stream_response() -> AsyncGenerator[bytes, None]:
+        ai_content_buffer: List[str] = []
+        had_error = False
         try:
             # 为前端提供EventSource格式
-            yield "data: {\"type\":\"start\", \"topicId\":\"" + topic_id + "\"}\n\n"
+            yield _sse_frame({"type": "start", "topicId": topic_id})
             
             # 准备历史记录（虽然在基本本地搜索中默认不使用）
-            history_for_llm = [msg.dict() for msg in topic.messages[-10:]]  # 限制历史记录长度
-            
-            # 获取完整回复（非流式），然后模拟逐字输出
-            full_ai_reply = await graphrag_processor.query_rag(user_message_content, history_for_llm)
-            
-            # 回复存储用
-            ai_content_buffer = ""
-            
-            # 逐字发送回复（模拟流式）
-            for char in full_ai_reply:
-                ai_content_buffer += char
-                yield f"data: {json.dumps({'type': 'chunk', 'content': char})}\n\n"
-                await asyncio.sleep(0.02)  # 控制输出速度，每字符约20ms
+            history_for_llm = [msg.model_dump() for msg in topic.messages[-10:]]  # 限制历史记录长度
             
-            # 保存AI回复到存储
-            ai_message = Message(role="assistant", content=full_ai_reply)
-            storage.add_message_to_topic(topic_id, ai_message)
-            
-            # 获取更新后的完整历史记录
-            updated_topic = storage.load_topic(topic_id)
-            history_json = json.dumps([msg.dict() for msg in updated_topic.messages]) if updated_topic else "[]"
-            
-            # 发送完成信号
-            yield f"data: {json.dumps({'type': 'end', 'topicId': topic_id, 'history': history_json})}\n\n"
+            # LLM 边生成边转发：每个增量立即作为 chunk 帧发出，同时累积完整回复
+            async for delta in graphrag_processor.query_rag_stream(user_message_content, history_for_llm):
+                ai_content_buffer.append(delta)
+                yield _sse_chunk_frame(delta)
             
         except Exception as e:
-            print(f"Error during GraphRAG query for topic {topic_id}: {e}")
-            traceback.print_exc()  # 记录完整错误
-            error_msg = f"抱歉，处理您的请求时发生内部错误。(Sorry, an internal error occurred while processing your request.)"
-            
-            # 保存错误消息
-            ai_message = Message(role="assistant", content=error_msg)
-            storage.add_message_to_topic(topic_id, ai_message)
-            
+            had_error = True
+            log.exception(f"Error during GraphRAG query for topic {topic_id}: {e}")  # 记录完整错误
             # 发送错误作为流式响应
-            yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
-            
-            # 获取更新后的历史记录
-            updated_topic = storage.load_topic(topic_id)
-            history_json = json.dumps([msg.dict() for msg in updated_topic.messages]) if updated_topic else "[]"
-            
-            # 发送完成信号
-            yield f"data: {json.dumps({'type': 'end', 'topicId': topic_id, 'history': history_json})}\n\n"
+            yield _sse_frame({"type": "error", "content": STREAM_ERROR_MESSAGE})
+        
+        # 统一收尾（成功与出错共用）：保存AI回复（出错时保存错误消息），然后发送完成信号
+        final_reply = STREAM_ERROR_MESSAGE if had_error else "".join(ai_content_buffer)
+        ai_message = Message.model_construct(role="assistant", content=final_reply)  # 服务端生成的可信数据，跳过校验
+        await storage.aadd_message_to_topic(topic_id, ai_message)
+        
+        # 只附带新增的 AI 消息，前端已有之前的历史；完整历史可通过 GET /api/topics/{id} 获取
+        yield _sse_frame({"type": "end", "topicId": topic_id, "lastMessage": ai_message.model_dump()})
     
     # 返回流式响应
     return StreamingResponse(
-        stream_response(),
+        _batch_sse_frames(stream_response()),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -170,30 +258,29 @@ async def post_message(topic_id: str, request: Request):
 @app.delete("/api/topics/{topic_id}", status_code=status.HTTP_200_OK)
 async def delete_topic(topic_id: str):
     """Deletes a specific chat topic file."""
-    print(f"Received request to delete topic: {topic_id}") # Keep this print
+    log.info(f"Received request to delete topic: {topic_id}")
 
     # --- RESTORE THIS LOGIC ---
-    deleted = storage.delete_topic_file(topic_id)
+    deleted = await storage.adelete_topic_file(topic_id)
     if not deleted:
-        topic_path = storage._get_topic_path(topic_id)
-        if os.path.exists(topic_path): # Check if file still exists after failed delete attempt
+        if await storage.atopic_exists(topic_id): # Check if the topic is still there after failed delete attempt
              # Log the error clearly on the backend
-             print(f"ERROR: storage.delete_topic_file reported failure for {topic_id}, and file still exists at {topic_path}. Raising 500.")
-             raise HTTPException(status_code=500, detail=f"Could not delete topic file for ID: {topic_id}. Check backend logs for file system errors.")
+             log.error(f"storage.delete_topic_file reported failure for {topic_id}, and the topic still exists. Raising 500.")
+             raise HTTPException(status_code=500, detail=f"Could not delete topic for ID: {topic_id}. Check backend logs for database errors.")
         else:
-             # File is gone now, even if delete_topic_file returned False (maybe race condition or it was already gone)
-             print(f"Topic file for {topic_id} is gone now, proceeding as success.")
+             # Topic is gone now, even if delete_topic_file returned False (maybe race condition or it was already gone)
+             log.info(f"Topic {topic_id} is gone now, proceeding as success.")
              pass # Proceed to return success message
     # --- END RESTORED LOGIC ---
 
-    print(f"Successfully processed DELETE request for topic {topic_id}") # Keep this print
+    log.info(f"Successfully processed DELETE request for topic {topic_id}")
     return {"message": f"Topic {topic_id} deleted successfully."}
 
 # --- ADD THIS NEW TEST ENDPOINT ---
 @app.delete("/api/test-delete/{item_id}", status_code=status.HTTP_200_OK)
 async def test_delete_endpoint(item_id: str):
     """A completely separate DELETE endpoint for testing."""
-    print(f"--- DEBUG: Reached /api/test-delete/{item_id} endpoint! ---")
+    log.debug("Reached /api/test-delete/%s endpoint", item_id)
     return {"message": f"Successfully processed DELETE for test item {item_id}"}
 # --- END OF NEW TEST ENDPOINT ---
 
@@ -203,5 +290,9 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     reload_flag = os.getenv("RELOAD", "true").lower() == "true" # Control reload via env var
-    print(f"Starting Uvicorn server on {host}:{port} (Reload: {reload_flag})...")
-    uvicorn.run("main:app", host=host, port=port, reload=reload_flag)
\ No newline at end of file
+    # Extra worker processes each load their own copy of the GraphRAG index; reload mode supports only one.
+    # Topic caches in storage.py are per-process and dropped when SQLite reports another connection's commit, so workers stay consistent.
+    workers = 1 if reload_flag else max(1, int(os.getenv("WORKERS", "1")))
+    log.info(f"Starting Uvicorn server on {host}:{port} (Reload: {reload_flag}, Workers: {workers})...")
+    # loop/http "auto" pick uvloop and httptools when installed (uvicorn[standard]); uvloop has no Windows support
+    uvicorn.run("main:app", host=host, port=port, reload=reload_flag, workers=workers, loop="auto", http="auto")
\ No newline at end of file
@@ -1,18 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class Message(BaseModel):
     role: str # "user" or "assistant"
     content: str
 
-class ChatRequest(BaseModel):
-    message: str
-    topic_id: str
-
-class ChatResponse(BaseModel):
-    reply: str
-    topic_id: str # Confirm topic ID in response
-    history: List[Message] # Return updated history
+class PostMessageRequest(BaseModel):
+    message: str = Field(min_length=1) # Body of POST /api/topics/{topic_id}/messages
 
 class NewTopicRequest(BaseModel):
     name: Optional[str] = None # Optional name for the new topic
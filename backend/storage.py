@@ -1,16 +1,21 @@
 # storage.py
 
 import os
-import json
+import re
 import uuid
+import asyncio
+import sqlite3
+import orjson
 import logging      # Added import (if not already present)
-import traceback    # <-- ADD THIS IMPORT
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Optional
 from models import Message, Topic, TopicInfo
 from dotenv import load_dotenv
 
 load_dotenv()
 CHAT_HISTORY_DIR = os.getenv("CHAT_HISTORY_DIR", "./chat_history")
+CHAT_DB_PATH = os.getenv("CHAT_DB_PATH", os.path.join(CHAT_HISTORY_DIR, "chat_history.sqlite3"))
 
 # Setup logger if needed, or rely on main's logging
 log = logging.getLogger(__name__)
@@ -21,58 +26,181 @@ if not log.hasHandlers():
 if not os.path.exists(CHAT_HISTORY_DIR):
     os.makedirs(CHAT_HISTORY_DIR)
 
-def _get_topic_path(topic_id: str) -> str:
-    """Gets the file path for a given topic ID."""
-    # Ensure topic_id is safe for filenames (though UUIDs usually are)
-    safe_topic_id = "".join(c for c in topic_id if c.isalnum() or c in ('-', '_')).rstrip()
+# Chat history lives in one SQLite database (WAL mode):
+#   topics(id, name, preview)               - one row per topic; preview kept up to date on append
+#   messages(topic_id, seq, role, content)  - appending a message is a single INSERT
+# Older per-topic {id}.json files are imported on startup and renamed with a ".migrated" suffix.
+LEGACY_SUFFIX = ".json"
+MIGRATED_SUFFIX = ".migrated"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    preview TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    topic_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (topic_id, seq)
+);
+"""
+
+# One shared connection (autocommit; writes use explicit BEGIN IMMEDIATE) guarded by a lock.
+# RLock so helpers can nest inside a write transaction.
+_DB_LOCK = threading.RLock()
+_conn = sqlite3.connect(CHAT_DB_PATH, check_same_thread=False, isolation_level=None)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("PRAGMA synchronous=NORMAL")
+_conn.executescript(_SCHEMA)
+
+# In-memory cache of parsed topics: topic id -> Topic. Reads populate it, writes
+# refresh it, deletes evict it; it is dropped whenever another connection (e.g. a
+# second uvicorn worker) commits, detected via PRAGMA data_version. Bounded LRU.
+TOPIC_CACHE_SIZE = 128
+_TOPIC_CACHE: "OrderedDict[str, Topic]" = OrderedDict()
+_data_version: Optional[int] = None
+
+def _copy_topic(topic: Topic) -> Topic:
+    """Shallow copy with its own message list, so callers can append without touching the cache."""
+    return topic.model_copy(update={"messages": list(topic.messages)})
+
+def _sync_cache_with_db():
+    """Clears the topic cache if another connection changed the database. Caller holds _DB_LOCK."""
+    global _data_version
+    version = _conn.execute("PRAGMA data_version").fetchone()[0]
+    if version != _data_version:
+        _TOPIC_CACHE.clear()
+        _data_version = version
+
+def _cache_get(topic_id: str) -> Optional[Topic]:
+    _sync_cache_with_db()
+    topic = _TOPIC_CACHE.get(topic_id)
+    if topic is None:
+        return None
+    _TOPIC_CACHE.move_to_end(topic_id)
+    return _copy_topic(topic)
+
+def _cache_put(topic_id: str, topic: Topic):
+    _TOPIC_CACHE[topic_id] = _copy_topic(topic)
+    _TOPIC_CACHE.move_to_end(topic_id)
+    while len(_TOPIC_CACHE) > TOPIC_CACHE_SIZE:
+        _TOPIC_CACHE.popitem(last=False)
+
+# Anything other than (Unicode) alphanumerics, '-' and '_'; \w covers str.isalnum() plus '_'
+_UNSAFE_TOPIC_ID_CHARS = re.compile(r"[^\w-]")
+
+def _safe_topic_id(topic_id: str) -> str:
+    # Keep topic IDs to a safe character set (though UUIDs usually are)
+    safe_topic_id = _UNSAFE_TOPIC_ID_CHARS.sub("", topic_id)
     if not safe_topic_id: # Handle empty/invalid IDs
         raise ValueError("Invalid topic ID provided")
-    return os.path.join(CHAT_HISTORY_DIR, f"{safe_topic_id}.json")
+    return safe_topic_id
+
+DEFAULT_PREVIEW = "New Topic"
+PREVIEW_LENGTH = 50
+
+def _make_preview(content: str) -> str:
+    return content[:PREVIEW_LENGTH] + ("..." if len(content) > PREVIEW_LENGTH else "")
+
+def _compute_preview(messages: List[Message]) -> str:
+    """Preview text for a topic: first user message, else first assistant message, else the first message."""
+    # Find first user message for preview
+    first_user_msg = next((m.content for m in messages if m.role == 'user'), None)
+    if first_user_msg:
+        return _make_preview(first_user_msg)
+    # If no user message, find first assistant message
+    first_assistant_msg = next((m.content for m in messages if m.role == 'assistant'), None)
+    if first_assistant_msg:
+        return _make_preview(first_assistant_msg)
+    if messages and messages[0].content: # Fallback if only non-user/assistant messages exist? Unlikely.
+        return messages[0].content[:PREVIEW_LENGTH] + "..."
+    return DEFAULT_PREVIEW
+
+def _write_topic(topic_id: str, topic: Topic):
+    """Replaces a topic row and all its messages. Caller holds _DB_LOCK inside a transaction."""
+    _conn.execute(
+        "INSERT OR REPLACE INTO topics (id, name, preview) VALUES (?, ?, ?)",
+        (topic_id, topic.name, _compute_preview(topic.messages)),
+    )
+    _conn.execute("DELETE FROM messages WHERE topic_id = ?", (topic_id,))
+    _conn.executemany(
+        "INSERT INTO messages (topic_id, seq, role, content) VALUES (?, ?, ?, ?)",
+        [(topic_id, seq, m.role, m.content) for seq, m in enumerate(topic.messages)],
+    )
 
 def save_topic(topic: Topic):
-    """Saves a topic's data to a JSON file."""
+    """Saves a topic's metadata and replaces its full message list (used on create/import)."""
     try:
-        filepath = _get_topic_path(topic.id)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(topic.model_dump(), f, ensure_ascii=False, indent=4) # Use model_dump for Pydantic v2+
-    except ValueError as ve: # Catch invalid topic ID from _get_topic_path
+        topic_id = _safe_topic_id(topic.id)
+        if topic_id != topic.id:
+            topic = topic.model_copy(update={"id": topic_id})
+        with _DB_LOCK:
+            _conn.execute("BEGIN IMMEDIATE")
+            try:
+                _write_topic(topic_id, topic)
+                _conn.execute("COMMIT")
+            except BaseException:
+                _conn.execute("ROLLBACK")
+                raise
+            _sync_cache_with_db()
+            _cache_put(topic_id, topic)
+    except ValueError as ve: # Catch invalid topic ID
          log.error(f"Error saving topic due to invalid ID '{topic.id}': {ve}")
-    except IOError as e:
-        log.error(f"Error saving topic file {topic.id}: {e}")
+    except sqlite3.Error as e:
+        log.error(f"Error saving topic {topic.id}: {e}")
     except Exception as e:
         log.error(f"Unexpected error saving topic {topic.id}: {e}")
 
 def load_topic(topic_id: str) -> Optional[Topic]:
-    """Loads a topic's data from a JSON file."""
+    """Loads a topic and its messages."""
     try:
-        filepath = _get_topic_path(topic_id)
-        if not os.path.exists(filepath):
-            return None
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return Topic(**data)
+        safe_id = _safe_topic_id(topic_id)
+        with _DB_LOCK:
+            cached = _cache_get(safe_id)
+            if cached is not None:
+                return cached
+            row = _conn.execute("SELECT id, name FROM topics WHERE id = ?", (safe_id,)).fetchone()
+            if row is None:
+                return None
+            messages = [
+                Message.model_construct(role=role, content=content)
+                for role, content in _conn.execute(
+                    "SELECT role, content FROM messages WHERE topic_id = ? ORDER BY seq", (safe_id,)
+                )
+            ]
+            topic = Topic(id=row[0], name=row[1], messages=messages)
+            _cache_put(safe_id, topic)
+            return topic
+    except sqlite3.Error as e:
+        log.error(f"Error loading topic {topic_id}: {e}")
+        return None
     except ValueError as ve: # Catch invalid topic ID
          log.error(f"Error loading topic due to invalid ID '{topic_id}': {ve}")
          return None
-    except (IOError, json.JSONDecodeError) as e:
-        log.error(f"Error loading or decoding topic file {topic_id}: {e}")
-        # Consider renaming corrupted file?
-        # try:
-        #     os.rename(filepath, filepath + ".corrupted")
-        # except OSError:
-        #     pass
-        return None
     except Exception as e:
         log.error(f"Unexpected error loading topic {topic_id}: {e}")
         return None
 
+def topic_exists(topic_id: str) -> bool:
+    """True if a topic row exists for topic_id."""
+    try:
+        safe_id = _safe_topic_id(topic_id)
+    except ValueError:
+        return False
+    with _DB_LOCK:
+        return _conn.execute("SELECT 1 FROM topics WHERE id = ?", (safe_id,)).fetchone() is not None
+
 
 def create_new_topic(name: Optional[str] = None) -> Topic:
     """Creates a new topic object and saves it."""
     topic_id = str(uuid.uuid4())
     if not name:
-         existing_topics = list_topics()
-         name = f"Topic {len(existing_topics) + 1}"
+         with _DB_LOCK:
+             topic_count = _conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
+         name = f"Topic {topic_count + 1}"
 
     topic = Topic(id=topic_id, name=name, messages=[])
     save_topic(topic)
@@ -80,91 +208,151 @@ def create_new_topic(name: Optional[str] = None) -> Topic:
     return topic
 
 def list_topics() -> List[TopicInfo]:
-    """Lists all available topics by reading filenames."""
-    topics = []
-    if not os.path.exists(CHAT_HISTORY_DIR) or not os.path.isdir(CHAT_HISTORY_DIR):
-         log.error(f"Chat history directory not found or not a directory: {CHAT_HISTORY_DIR}")
-         return []
+    """Lists all available topics (id, name and stored preview; messages are not read)."""
     try:
-        for filename in os.listdir(CHAT_HISTORY_DIR):
-            if filename.endswith(".json") and not filename.endswith(".corrupted"): # Ignore corrupted
-                topic_id = filename[:-5]
-                # Basic load just to get name/preview, faster than full load?
-                # Or full load is fine if files aren't huge. Sticking with full load.
-                topic = load_topic(topic_id)
-                if topic:
-                    preview = "New Topic"
-                    # Find first user message for preview
-                    first_user_msg = next((m.content for m in topic.messages if m.role == 'user'), None)
-                    if first_user_msg:
-                        preview = first_user_msg[:50] + ("..." if len(first_user_msg) > 50 else "")
-                    # If no user message, find first assistant message
-                    elif topic.messages:
-                        first_assistant_msg = next((m.content for m in topic.messages if m.role == 'assistant'), None)
-                        if first_assistant_msg:
-                             preview = first_assistant_msg[:50] + ("..." if len(first_assistant_msg) > 50 else "")
-                        else: # Fallback if only non-user/assistant messages exist? Unlikely.
-                             preview = topic.messages[0].content[:50] + "..." if topic.messages[0].content else preview
-
-
-                    topics.append(TopicInfo(id=topic.id, name=topic.name, preview=preview))
-
+        with _DB_LOCK:
+            rows = _conn.execute("SELECT id, name, preview FROM topics").fetchall()
+        topics = [TopicInfo(id=row[0], name=row[1], preview=row[2]) for row in rows]
         # Sort topics by name (case-insensitive)
         topics.sort(key=lambda t: t.name.lower())
-    except OSError as e:
-        log.error(f"Error listing topics in {CHAT_HISTORY_DIR}: {e}")
+        return topics
+    except sqlite3.Error as e:
+        log.error(f"Error listing topics from {CHAT_DB_PATH}: {e}")
     except Exception as e:
         log.error(f"Unexpected error listing topics: {e}")
-    return topics
+    return []
 
 def add_message_to_topic(topic_id: str, message: Message) -> Optional[Topic]:
-    """Adds a message to a topic and saves it."""
-    # It might be slightly more efficient to load, modify, save in the endpoint
-    # But this keeps storage logic together. Consider performance if needed.
-    topic = load_topic(topic_id)
-    if topic:
-        topic.messages.append(message)
-        save_topic(topic) # This handles potential save errors
-        return topic
-    else:
-         log.warning(f"Attempted to add message to non-existent or unloadable topic: {topic_id}")
-         return None
+    """Appends a message to a topic and returns the updated topic."""
+    try:
+        safe_id = _safe_topic_id(topic_id)
+    except ValueError as ve:
+        log.error(f"Error adding message due to invalid ID '{topic_id}': {ve}")
+        return None
+    with _DB_LOCK:
+        try:
+            _conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Read the topic inside the write transaction: no other worker can commit
+                # between this read and the append, so the topic cached below is current
+                topic = load_topic(safe_id)
+                if not topic:
+                    _conn.execute("ROLLBACK")
+                    log.warning(f"Attempted to add message to non-existent or unloadable topic: {topic_id}")
+                    return None
+                next_seq = _conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE topic_id = ?", (safe_id,)
+                ).fetchone()[0]
+                _conn.execute(
+                    "INSERT INTO messages (topic_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    (safe_id, next_seq, message.role, message.content),
+                )
+                # The preview only changes for the first message, or the first user message
+                if next_seq == 0 or (message.role == 'user' and not any(m.role == 'user' for m in topic.messages)):
+                    _conn.execute(
+                        "UPDATE topics SET preview = ? WHERE id = ?",
+                        (_compute_preview(topic.messages + [message]), safe_id),
+                    )
+                _conn.execute("COMMIT")
+            except BaseException:
+                _conn.execute("ROLLBACK")
+                raise
+            topic.messages.append(message)
+            _cache_put(safe_id, topic)
+            return topic
+        except sqlite3.Error as e:
+            log.error(f"Error appending message to topic {topic_id}: {e}")
+        except Exception as e:
+            log.error(f"Unexpected error appending message to topic {topic_id}: {e}")
+        return None
 
 def delete_topic_file(topic_id: str) -> bool:
-    """Deletes the JSON file associated with a topic ID.
+    """Deletes a topic and its messages.
 
     Returns:
-        True if deletion was successful or file didn't exist, False on error.
+        True if deletion was successful or the topic didn't exist, False on error.
     """
     try:
-        filepath = _get_topic_path(topic_id) # Can raise ValueError
+        safe_id = _safe_topic_id(topic_id)
     except ValueError as ve:
         log.error(f"Error deleting topic due to invalid ID '{topic_id}': {ve}")
         return False # Treat invalid ID as failure to delete
 
-    if not os.path.exists(filepath):
-        log.warning(f"Attempted to delete non-existent topic file: {filepath}")
-        return True # File is already gone
-
     try:
-        log.info(f"Attempting to delete topic file: {filepath}")
-        os.remove(filepath)
-        # Verify deletion (optional sanity check)
-        if not os.path.exists(filepath):
-            log.info(f"Successfully deleted topic file: {filepath}")
-            return True
+        with _DB_LOCK:
+            _TOPIC_CACHE.pop(safe_id, None)
+            log.info(f"Attempting to delete topic: {safe_id}")
+            _conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = _conn.execute("DELETE FROM topics WHERE id = ?", (safe_id,)).rowcount
+                _conn.execute("DELETE FROM messages WHERE topic_id = ?", (safe_id,))
+                _conn.execute("COMMIT")
+            except BaseException:
+                _conn.execute("ROLLBACK")
+                raise
+        if deleted:
+            log.info(f"Successfully deleted topic: {safe_id}")
         else:
-            log.error(f"os.remove completed for {filepath} but file still exists!")
-            return False
-    except PermissionError as pe:
-        log.error(f"PermissionError deleting topic file {filepath}: {pe}")
-        return False
-    except OSError as e:
-        # Catch other OS-level errors (e.g., file locked)
-        log.error(f"OSError deleting topic file {filepath}: {e}")
+            log.warning(f"Attempted to delete non-existent topic: {safe_id}")
+        return True
+    except sqlite3.Error as e:
+        # Catch database errors (e.g., database locked)
+        log.error(f"Database error deleting topic {safe_id}: {e}")
         return False
     except Exception as e:
         # Catch any other unexpected error
-        log.error(f"Unexpected error deleting topic file {filepath}: {e}")
-        log.debug(traceback.format_exc()) # Log traceback for unexpected errors
-        return False
\ No newline at end of file
+        log.exception(f"Unexpected error deleting topic {safe_id}: {e}") # Includes the traceback
+        return False
+
+
+# --- Import of file-based chat history ---
+def _import_file_topics():
+    """Imports legacy {id}.json topic files from CHAT_HISTORY_DIR into the database (once per file)."""
+    try:
+        # scandir reports the file type from the directory listing itself, so hidden,
+        # non-regular and non-topic entries are skipped without an extra stat each.
+        # Collected up front because importing renames files in this directory.
+        with os.scandir(CHAT_HISTORY_DIR) as it:
+            paths = [
+                e.path for e in it
+                if e.name.endswith(LEGACY_SUFFIX) and not e.name.startswith('.') and e.is_file()
+            ]
+    except OSError as e:
+        log.error(f"Error scanning {CHAT_HISTORY_DIR} for file-based topics: {e}")
+        return
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                topic = Topic.model_validate(orjson.loads(f.read()))
+            if not topic_exists(topic.id):
+                save_topic(topic)
+                if not topic_exists(topic.id):
+                    continue # Save failed (already logged); keep the file
+                log.info(f"Imported file-based topic into database: {topic.id}")
+            os.replace(path, path + MIGRATED_SUFFIX)
+        except Exception as e:
+            log.error(f"Could not import topic file {path}: {e}")
+
+_import_file_topics()
+
+
+# --- Async wrappers ---
+# Storage calls block on SQLite; these run them on the default thread pool so
+# FastAPI's event loop stays responsive while a request waits on the database.
+async def aload_topic(topic_id: str) -> Optional[Topic]:
+    return await asyncio.to_thread(load_topic, topic_id)
+
+async def acreate_new_topic(name: Optional[str] = None) -> Topic:
+    return await asyncio.to_thread(create_new_topic, name)
+
+async def alist_topics() -> List[TopicInfo]:
+    return await asyncio.to_thread(list_topics)
+
+async def aadd_message_to_topic(topic_id: str, message: Message) -> Optional[Topic]:
+    return await asyncio.to_thread(add_message_to_topic, topic_id, message)
+
+async def adelete_topic_file(topic_id: str) -> bool:
+    return await asyncio.to_thread(delete_topic_file, topic_id)
+
+async def atopic_exists(topic_id: str) -> bool:
+    return await asyncio.to_thread(topic_exists, topic_id)
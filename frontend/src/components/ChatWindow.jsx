@@ -71,8 +71,11 @@ function ChatWindow({ selectedTopicId, topicData, onMessagesUpdate }) {
             // 流式数据全部接收完毕
             setIsStreaming(false);
             
-            // 使用后端返回的完整历史
-            if (finalResponse.history && finalResponse.history.length > 0) {
+            // 用后端保存的 AI 消息替换占位消息
+            if (finalResponse.lastMessage) {
+                onMessagesUpdate(selectedTopicId, [...currentMessages, finalResponse.lastMessage]);
+            } else if (finalResponse.history && finalResponse.history.length > 0) {
+                // 兼容旧版后端返回的完整历史
                 onMessagesUpdate(selectedTopicId, finalResponse.history);
             }
             
@@ -51,7 +51,8 @@ export const sendMessage = (topicId, message, onChunkReceived) => {
             chunks: [],   // 收到的内容片段
             reply: '',    // 完整回复内容
             topicId: topicId, 
-            history: [],  // 完整会话历史
+            history: [],  // 完整会话历史（旧版后端在 end 事件中返回）
+            lastMessage: null, // 本轮新增的 AI 消息（end 事件返回）
             streaming: true, // 指示是否正在流式接收中
             error: null   // 可能的错误信息
         };
@@ -177,6 +178,11 @@ export const sendMessage = (topicId, message, onChunkReceived) => {
                                 responseState.completed = true;
                                 responseState.streaming = false;
                                 
+                                // 新版后端只返回本轮新增的消息
+                                if (event.lastMessage) {
+                                    responseState.lastMessage = event.lastMessage;
+                                }
+                                
                                 // 如果收到了历史记录，解析它
                                 if (event.history) {
                                     try {
@@ -192,6 +198,7 @@ export const sendMessage = (topicId, message, onChunkReceived) => {
                                     reply: responseState.reply,
                                     topic_id: responseState.topicId,
                                     history: responseState.history,
+                                    lastMessage: responseState.lastMessage,
                                     streaming: false // 已完成
                                 });
                                 break;